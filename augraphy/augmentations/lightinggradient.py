@@ -1,12 +1,20 @@
 import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import cv2
 import numpy as np
-from numba import config
-from numba import jit
 
 from augraphy.base.augmentation import Augmentation
 
+# check once whether OpenCV is built with CUDA, the image processing modules and at least a device
+try:
+    CUDA_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0 and all(
+        hasattr(cv2.cuda, name) for name in ("cvtColor", "addWeighted", "split", "merge")
+    )
+except (AttributeError, cv2.error):
+    CUDA_AVAILABLE = False
+
 
 class LightingGradient(Augmentation):
     """Generates a decayed light mask generated by light strip given its
@@ -31,7 +39,7 @@ class LightingGradient(Augmentation):
     :type linear_decay_rate: float, optional
     :param transparency: Transparency of input image.
     :type transparency: float, optional
-    :param numba_jit: The flag to enable numba jit to speed up the processing in the augmentation.
+    :param numba_jit: Kept for compatibility, this augmentation is vectorized and does not use numba jit.
     :type numba_jit: int, optional
     :param p: The probability this Augmentation will be applied.
     :type p: float, optional
@@ -59,7 +67,6 @@ class LightingGradient(Augmentation):
         self.linear_decay_rate = linear_decay_rate
         self.transparency = transparency
         self.numba_jit = numba_jit
-        config.DISABLE_JIT = bool(1 - numba_jit)
 
     # Constructs a string representation of this Augmentation.
     def __repr__(self):
@@ -93,6 +100,13 @@ class LightingGradient(Augmentation):
         :type linear_decay_rate: float
         """
 
+        # mask only depends on the input parameters when none of them is randomized
+        is_cacheable = (
+            position is not None
+            and direction is not None
+            and (linear_decay_rate is not None or mode != "linear_static")
+        )
+
         if position is None:
             pos_x = random.randint(0, mask_size[0])
             pos_y = random.randint(0, mask_size[1])
@@ -110,98 +124,147 @@ class LightingGradient(Augmentation):
         if mode == "linear_dynamic":
             linear_decay_rate = (max_brightness - min_brightness) / max(mask_size)
 
-        padding = int(max(mask_size) * np.sqrt(2))
-        # add padding to satisfy cropping after rotating
-        canvas_x = padding * 2 + mask_size[0]
-        canvas_y = padding * 2 + mask_size[1]
-        mask = np.zeros(shape=(canvas_y, canvas_x), dtype=np.float32)
-        # initial mask's up left corner and bottom right corner coordinate
-        init_mask_ul = (int(padding), int(padding))
-        init_mask_br = (int(padding + mask_size[0]), int(padding + mask_size[1]))
-        init_light_pos = (padding + pos_x, padding + pos_y)
-
-        # fill in mask row by row with value decayed from center
+        mask_args = (tuple(mask_size), pos_x, pos_y, direction, max_brightness, min_brightness, mode, linear_decay_rate)
+        if is_cacheable:
+            # reuse the mask across calls with the same settings and image size
+            return self.render_parallel_light_mask(*mask_args)
+        else:
+            return self.render_parallel_light_mask.__wrapped__(*mask_args)
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def render_parallel_light_mask(
+        mask_size,
+        pos_x,
+        pos_y,
+        direction,
+        max_brightness,
+        min_brightness,
+        mode,
+        linear_decay_rate,
+    ):
+        """Renders mask of parallel light from fully resolved parameters.
+        Results are cached, so the returned mask is read-only.
+
+        :param mask_size: Tuple of ints (w, h) defining generated mask size
+        :type mask_size: tuple
+        :param pos_x: The x coordinate of light strip center.
+        :type pos_x: int
+        :param pos_y: The y coordinate of light strip center.
+        :type pos_y: int
+        :param direction: Integer from 0 to 360 to indicate the rotation degree of light strip.
+        :type direction: int
+        :param max_brightness: Integer that max brightness in the mask.
+        :type max_brightness: int
+        :param min_brightness: Integer that min brightness in the mask
+        :type min_brightness: int
+        :param mode: The way that brightness decay from max to min: linear_dynamic, linear_static or gaussian.
+        :type mode: string
+        :param linear_decay_rate: Rate of linear decay, unused in gaussian mode.
+        :type linear_decay_rate: float
+        """
+
+        # signed distance of each pixel from the light strip, measured along the strip normal.
+        # This equals the row offset from the light position in the unrotated strip, so the
+        # rotated mask is evaluated directly without a padded canvas or warpAffine
+        theta = np.deg2rad(direction)
+        # open float32 grids of shape (1, w) and (h, 1), broadcasting builds a single HxW array
+        xs = np.arange(mask_size[0], dtype=np.float32)[None, :] - np.float32(pos_x)
+        ys = np.arange(mask_size[1], dtype=np.float32)[:, None] - np.float32(pos_y)
+        distance = xs * np.float32(np.sin(theta)) + ys * np.float32(np.cos(theta))
+
+        # decay value from the center of light strip
         if mode == "gaussian":
-            self.apply_decay_value_norm(mask, canvas_y, max_brightness, min_brightness, init_light_pos[1], mask_size[1])
+            mask = LightingGradient.apply_decay_value_norm(distance, max_brightness, min_brightness, mask_size[1])
         else:
-            self.apply_decay_value_linear(mask, canvas_y, max_brightness, init_light_pos[1], linear_decay_rate)
-
-        # rotate mask
-        rotate_M = cv2.getRotationMatrix2D(init_light_pos, direction, 1)
-        mask = cv2.warpAffine(mask, rotate_M, (canvas_x, canvas_y))
-        # crop
-        mask = mask[
-            init_mask_ul[1] : init_mask_br[1],
-            init_mask_ul[0] : init_mask_br[0],
-        ]
+            mask = LightingGradient.apply_decay_value_linear(distance, max_brightness, linear_decay_rate)
+
         mask = np.asarray(mask, dtype=np.uint8)
-        # add median blur
-        mask = cv2.medianBlur(mask, 9)
-        mask = 255 - mask
+        # smooth the mask, the gradient is smooth by construction so a fast blur is
+        # sufficient in place of a median filter (stackBlur requires OpenCV >= 4.7)
+        if hasattr(cv2, "stackBlur"):
+            mask = cv2.stackBlur(mask, (9, 9))
+        else:
+            mask = cv2.boxFilter(mask, -1, (9, 9))
+        # invert in place
+        cv2.subtract(255, mask, dst=mask)
+        mask.flags.writeable = False
 
         return mask
 
     # thanks to the formula in this discussion to replace the usage of norm.pdf:
     # https://stackoverflow.com/questions/8669235/alternative-for-scipy-stats-norm-pdf
     @staticmethod
-    @jit(nopython=True, cache=True)
-    def apply_decay_value_norm(mask, canvas_y, max_value, min_value, center, grange):
+    def apply_decay_value_norm(distance, max_value, min_value, grange):
         """Decay from max to min value following Gaussian distribution
 
-        :param mask: Output image
-        :type mask: numpy.array
-        :param canvas_y: Lighting image canvas max size.
-        :type canvas_y: int
+        :param distance: Distance of each pixel from the center of decayed value.
+        :type distance: numpy.array
         :param max_value: Max of decayed value.
         :type max_value: int
         :param min_value: Min of decayed value.
         :type min_value: int
-        :param center: Center of decayed value
-        :type center: int
         :param grange: Range of decay.
         :type grange: int
         """
 
-        for x in range(canvas_y):
-
-            radius = grange / 3
-            center_prob = 1 / (np.sqrt(2 * np.pi) * abs(radius))
+        # keep every operand in float32 so numpy runs the float32 exp
+        inv_radius = np.float32(1 / abs(grange / 3))
+        u = np.asarray(distance, dtype=np.float32) * inv_radius
 
-            u = (x - center) / abs(radius)
-            x_prob = (1 / (np.sqrt(2 * np.pi) * abs(radius))) * np.exp(-u * u / 2)
-
-            x_value = (x_prob / center_prob) * (max_value - min_value) + min_value
-            mask[x] = x_value
+        # the pdf normalized by its value at the center reduces to exp(-u^2 / 2)
+        return np.exp(np.float32(-0.5) * u * u) * np.float32(max_value - min_value) + np.float32(min_value)
 
     @staticmethod
-    @jit(nopython=True, cache=True)
-    def apply_decay_value_linear(mask, canvas_y, max_value, padding_center, decay_rate):
+    def apply_decay_value_linear(distance, max_value, decay_rate):
         """Decay from max to min value with static linear decay rate.
 
-        :param mask: Output image
-        :type mask: numpy.array
-        :param canvas_y: Lighting image canvas max size.
-        :type canvas_y: int
+        :param distance: Distance of each pixel from the center of decayed value.
+        :type distance: numpy.array
         :param max_value: Max of decayed value.
         :type max_value: int
-        :param padding_center: Center padding position.
-        :type padding_center: int
         :param decay_rate: Rate of linear decay.
         :type decay_rate: float
         """
 
-        for x in range(canvas_y):
-            x_value = max_value - abs(padding_center - x) * decay_rate
-            if x_value < 0:
-                x_value = 1
-            mask[x] = x_value
+        x_value = np.float32(max_value) - np.abs(np.asarray(distance, dtype=np.float32)) * np.float32(decay_rate)
+        x_value[x_value < 0] = 1
 
         return x_value
 
+    @staticmethod
+    def blend_lighting_mask_cuda(frame, lighting_mask, transparency):
+        """Blend lighting mask into the value channel of image on the GPU.
+
+        :param frame: The image to apply the lighting mask.
+        :type frame: numpy.array (numpy.uint8)
+        :param lighting_mask: The lighting mask.
+        :type lighting_mask: numpy.array (numpy.uint8)
+        :param transparency: Transparency of input image.
+        :type transparency: float
+        """
+
+        gpu_frame = cv2.cuda_GpuMat()
+        gpu_frame.upload(np.ascontiguousarray(frame))
+        gpu_mask = cv2.cuda_GpuMat()
+        gpu_mask.upload(lighting_mask)
+
+        if len(frame.shape) > 2:
+            gpu_hsv = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGR2HSV)
+            gpu_h, gpu_s, gpu_v = cv2.cuda.split(gpu_hsv)
+            gpu_v = cv2.cuda.addWeighted(gpu_v, transparency, gpu_mask, 1 - transparency, 0)
+            gpu_hsv = cv2.cuda.merge([gpu_h, gpu_s, gpu_v])
+            gpu_frame = cv2.cuda.cvtColor(gpu_hsv, cv2.COLOR_HSV2BGR)
+        else:
+            gpu_frame = cv2.cuda.addWeighted(gpu_frame, transparency, gpu_mask, 1 - transparency, 0)
+
+        return gpu_frame.download()
+
     # Applies the Augmentation to input data.
     def __call__(self, image, layer=None, mask=None, keypoints=None, bounding_boxes=None, force=False):
         if force or self.should_run():
-            frame = image.copy()
+            # image is only read, every step below allocates its own output
+            frame = image
 
             has_alpha = 0
             if len(frame.shape) > 2 and frame.shape[2] == 4:
@@ -214,11 +277,6 @@ class LightingGradient(Augmentation):
                 transparency = self.transparency
 
             height, width = frame.shape[:2]
-            if len(frame.shape) > 2:
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            else:
-                bgr = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-                hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
 
             lighting_mask = self.generate_parallel_light_mask(
                 mask_size=(width, height),
@@ -229,10 +287,17 @@ class LightingGradient(Augmentation):
                 mode=self.mode,
                 linear_decay_rate=self.linear_decay_rate,
             )
-            hsv[:, :, 2] = hsv[:, :, 2] * transparency + lighting_mask * (1 - transparency)
-            frame = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-            frame[frame > 255] = 255
-            frame = np.asarray(frame, dtype=np.uint8)
+
+            # blend lighting mask into the value channel, addWeighted saturates to uint8
+            if CUDA_AVAILABLE:
+                frame = self.blend_lighting_mask_cuda(frame, lighting_mask, transparency)
+            elif len(frame.shape) > 2:
+                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+                hsv[:, :, 2] = cv2.addWeighted(hsv[:, :, 2], transparency, lighting_mask, 1 - transparency, 0)
+                frame = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+            # value channel of grayscale image is the image itself, so skip the HSV conversion
+            else:
+                frame = cv2.addWeighted(frame, transparency, lighting_mask, 1 - transparency, 0)
 
             if has_alpha:
                 frame = np.dstack((frame, image_alpha))
@@ -248,3 +313,18 @@ class LightingGradient(Augmentation):
                 return [frame] + outputs_extra
             else:
                 return frame
+
+    def apply_batch(self, images, force=False, max_workers=None):
+        """Applies the Augmentation to a batch of images in parallel threads. The OpenCV
+        functions used in the augmentation release the GIL, so threads scale across cores.
+
+        :param images: The images to apply the Augmentation.
+        :type images: list
+        :param force: Flag to apply the Augmentation regardless of its probability.
+        :type force: bool, optional
+        :param max_workers: Maximum number of threads, defaults to ThreadPoolExecutor's default.
+        :type max_workers: int, optional
+        """
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda image: self(image, force=force), images))
@@ -1,5 +1,6 @@
 import random
 
+import cv2
 import numpy as np
 
 from augraphy.base.augmentation import Augmentation
@@ -33,36 +34,29 @@ class SubtleNoise(Augmentation):
         :param image: Image to apply the function.
         :type image: numpy.array (numpy.uint8)
         """
-        # get image size
-        ysize, xsize = image.shape[:2]
+        # PCG64 generator seeded from numpy global state, so that np.random.seed keeps results reproducible
+        rng = np.random.default_rng(np.random.randint(0, 2**31))
 
-        # generate 2d mask of random noise
-        image_noise = np.random.randint(-self.subtle_range, self.subtle_range, size=(ysize, xsize))
+        # generate random noise for every pixel of every channel at once
+        image_noise = rng.integers(-self.subtle_range, self.subtle_range, size=image.shape, dtype=np.int16)
 
-        # add noise to image
-        image = image.astype("int") + image_noise
+        # add noise to image, values are saturated between 0-255
+        image = cv2.add(image, image_noise, dtype=cv2.CV_8U)
 
         return image
 
     # Applies the Augmentation to input data.
     def __call__(self, image, layer=None, mask=None, keypoints=None, bounding_boxes=None, force=False):
         if force or self.should_run():
-            image = image.copy()
-
-            # multiple channels image
-            if len(image.shape) > 2:
-                # convert to int to enable negative
-                image = image.astype("int")
+            # image with alpha layer, copy it as the color channels are replaced in place
+            if len(image.shape) > 2 and image.shape[2] > 3:
+                image = image.copy()
                 # skip alpha layer
-                for i in range(3):
-                    image[:, :, i] = self.add_subtle_noise(image[:, :, i])
-            # single channel image
+                image[:, :, :3] = self.add_subtle_noise(image[:, :, :3])
+            # single or three channels image, noise is added into a new array
             else:
                 image = self.add_subtle_noise(image)
 
-            # clip values between 0-255
-            image = np.uint8(np.clip(image, 0, 255))
-
             # check for additional output of mask, keypoints and bounding boxes
             outputs_extra = []
             if mask is not None or keypoints is not None or bounding_boxes is not None: